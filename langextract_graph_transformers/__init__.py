@@ -0,0 +1,4 @@
+from langextract_graph_transformers._cache import ExtractionCache
+from langextract_graph_transformers.langextract_graph_transformer import LangExtractGraphTransformer
+
+__all__ = ["ExtractionCache", "LangExtractGraphTransformer"]
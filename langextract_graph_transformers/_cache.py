@@ -0,0 +1,81 @@
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+import json
+import os
+import tempfile
+import time
+
+_MISSING = object()
+
+
+class ExtractionCache(MutableMapping):
+    """
+    A content-addressable on-disk cache for raw LLM extraction output.
+    Each entry is stored as `{key}.json` containing `{"raw": ..., "ts": ..., "model": ...}`.
+    It behaves like a mapping from key to raw text, so it can be passed anywhere a dict is accepted.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Returns the raw text stored for `key`, or `default` if it is missing or unreadable."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)["raw"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return default
+
+    def put(self, key: str, raw: str, model: Optional[str] = None) -> None:
+        """Stores the raw text for `key`. The file is written atomically so readers never see a partial entry."""
+        record = {"raw": raw, "ts": time.time(), "model": model}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def __getitem__(self, key: str) -> str:
+        raw = self.get(key)
+        if raw is None:
+            raise KeyError(key)
+        return raw
+
+    def __setitem__(self, key: str, raw: str) -> None:
+        self.put(key, raw)
+
+    def __delitem__(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def pop(self, key: str, default: Any = _MISSING) -> Any:
+        """
+        Removes `key` and returns its raw text, or `default` if it is missing. Unlike the
+        `MutableMapping` default, an entry removed concurrently by another caller is not an error.
+        """
+        raw = self.get(key)
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+        if raw is not None:
+            return raw
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def __iter__(self) -> Iterator[str]:
+        return (path.stem for path in self.cache_dir.glob("*.json"))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.cache_dir.glob("*.json"))
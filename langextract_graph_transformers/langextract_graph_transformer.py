@@ -1,18 +1,123 @@
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Dict, Iterable, Iterator, MutableMapping, Tuple, Union, FrozenSet
+from pathlib import Path
 import langextract as lx
 from langchain_community.graphs.graph_document import Node, Relationship, GraphDocument
 from langchain_core.documents import Document
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+from langextract_graph_transformers._cache import ExtractionCache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+import asyncio
+import functools
+import hashlib
+import itertools
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import json
 import re
 import logging
+import threading
+import time
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Suppress the specific ABSL warning about prompt alignment
 logging.getLogger('absl').setLevel(logging.ERROR)
 
+# Whitespace and punctuation only; Unicode letters and digits are word characters and are kept
+_PROP_KEY_RE = re.compile(r"[^\w]")
+_BATCH_MODES = ("online", "batch", "auto")
+_TRANSIENT_STATUS_CODES = {429, 500, 503}
+_BATCH_TERMINAL_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+_BATCH_POLL_INITIAL_SECONDS = 10
+_BATCH_POLL_MAX_SECONDS = 120
+_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 60
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    """
+    Parses JSON with orjson when it is installed, falling back to the standard library.
+    Output orjson rejects but json accepts (e.g. NaN from the model) is retried with json.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_property_key(key: Any) -> str:
+    """
+    Lower-cases a property key, replaces whitespace and punctuation with an underscore and adds
+    the `prop_` prefix. Non-ASCII letters and digits are kept so distinct keys stay distinct.
+    Models reuse a small vocabulary of keys, so results are memoized.
+    """
+    return "prop_" + _PROP_KEY_RE.sub("_", str(key).lower())
+
+
+def _length_prefixed(part: bytes) -> bytes:
+    """Prefixes a byte string with its length so concatenated key parts cannot collide."""
+    return len(part).to_bytes(8, "big") + part
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serializes JSON compactly, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _json_dumps_indented(obj: Any) -> str:
+    """Serializes JSON with a two-space indent, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_client(project_id: str, location: str) -> genai.Client:
+    """
+    Returns a Vertex AI genai client shared by every transformer for the same project and
+    location, so TLS connections and auth discovery are paid once rather than per instance.
+    """
+    return genai.Client(vertexai=True, project=project_id, location=location)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_language_model(model_id: str, project: str, location: str, batch: Optional[tuple] = None) -> Any:
+    """
+    Returns a langextract model shared by every transformer with the same configuration, so the
+    underlying genai client and its connection pool persist across documents and instances.
+    """
+    provider_kwargs = {"vertexai": True, "project": project, "location": location}
+    if batch:
+        provider_kwargs["batch"] = dict(batch)
+    return lx.factory.create_model(
+        config=lx.factory.ModelConfig(model_id=model_id, provider_kwargs=provider_kwargs),
+        examples=[LangExtractGraphTransformer._get_arbitrary_example()],
+        use_schema_constraints=True,
+    )
+
+
+def _is_transient_error(exception: BaseException) -> bool:
+    """Whether a genai error is a rate limit or transient server error worth retrying."""
+    return isinstance(exception, genai_errors.APIError) and exception.code in _TRANSIENT_STATUS_CODES
+
+
 class LangExtractGraphTransformer:
     """
-    A graph transformer that uses langextract to extract graph structures from documents.
+    A graph transformer that extracts graph structures from documents.
     It supports both schema-driven extraction and arbitrary (schema-less) extraction.
+
+    By default the model is called directly through the genai client with a JSON response
+    type. Set `use_langextract=True` to route extraction through langextract's
+    meta-extraction instead.
     """
 
     def __init__(
@@ -22,24 +127,106 @@ class LangExtractGraphTransformer:
         node_properties: Optional[List[str]] = None,
         relationship_properties: Optional[List[str]] = None,
         model_id: str = "gemini-2.5-pro",
+        batch_config: Optional[Dict[str, Any]] = None,
+        batch_length: int = 10,
+        max_concurrency: int = 8,
+        cache: Optional[Union[MutableMapping[str, str], str, Path]] = None,
+        use_langextract: bool = False,
+        batch_mode: str = "online",
+        batch_threshold: int = 50,
+        batch_gcs_uri: Optional[str] = None,
+        context_cache_ttl_seconds: Optional[int] = None,
     ):
         self.project_id = project_id
         self.location = location
         self.node_properties = node_properties
         self.relationship_properties = relationship_properties
         self.model_id = model_id
+        # Normalized property keys to keep; empty means every extracted property is kept
+        self._allowed_node_keys = frozenset(_normalize_property_key(p) for p in node_properties or [])
+        self._allowed_relationship_keys = frozenset(_normalize_property_key(p) for p in relationship_properties or [])
         self.model_config = {
             "vertexai": True,
             "project": project_id,
             "location": location,
         }
+        # Gemini Batch API settings forwarded to langextract, e.g.
+        # {"enabled": True, "threshold": 10, "enable_caching": False, "retention_days": 1}
+        self.batch_length = batch_length
+        self.max_concurrency = max_concurrency
+        if batch_config:
+            self.model_config["batch"] = batch_config
+        # Built once so the prompt prefix is byte-identical across requests and
+        # eligible for server-side context caching.
+        self._prompt = self._build_prompt()
+        self._example = self._get_arbitrary_example()
+        # Optional mapping (e.g. a dict, diskcache.Cache or ExtractionCache) from a document's
+        # cache key to its raw GraphJSON; a directory path creates an on-disk ExtractionCache.
+        self.cache = ExtractionCache(cache) if isinstance(cache, (str, Path)) else cache
+        self._prompt_version = hashlib.md5(self._prompt.encode("utf-8")).hexdigest()[:8]
+        self.use_langextract = use_langextract
+        # In-flight extractions keyed by cache key, so concurrent duplicates share one model call
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        # Everything except the document text is fixed per instance, so hash it once and copy
+        self._cache_key_hash = hashlib.sha256(b"".join(_length_prefixed(part.encode("utf-8")) for part in (
+            "langextract" if use_langextract else "genai",
+            model_id,
+            self._prompt_version,
+            json.dumps(node_properties, sort_keys=True),
+            json.dumps(relationship_properties, sort_keys=True),
+        )))
+        if not use_langextract:
+            self._client = _get_client(project_id, location)
+            self._generation_config = types.GenerateContentConfig(response_mime_type="application/json")
+            self._direct_prompt = self._build_direct_prompt()
+            self._request_gate = threading.Semaphore(max_concurrency)
+        # Opt-in Vertex AI context caching of the static prompt prefix, created on first use. Vertex
+        # only caches content above a per-model minimum (2,048 tokens for gemini-2.5-pro, 1,024 for
+        # gemini-2.5-flash); the built-in prompt is around 400 tokens, so this pays off only once the
+        # node/relationship property lists make the prompt large enough. Smaller prompts are rejected
+        # with a 400, after which the prompt is sent inline for the rest of the instance's lifetime.
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        self._context_cache_disabled = False
+        self._context_cached_config: Optional[types.GenerateContentConfig] = None
+        self._context_cache_expires_at = 0.0
+        self._context_cache_lock = threading.Lock()
+        # Vertex AI batch prediction for the direct path: "online" never batches, "batch" always
+        # does and "auto" batches once a call has at least `batch_threshold` documents. Batch
+        # jobs read and write JSONL under `batch_gcs_uri` (gs://bucket/prefix). Only `process_documents`
+        # batches; the async and streaming entry points always send online requests.
+        if batch_mode not in _BATCH_MODES:
+            raise ValueError(f"batch_mode must be one of {_BATCH_MODES}, got {batch_mode!r}")
+        if batch_mode != "online" and use_langextract:
+            raise ValueError("batch_mode only applies to the direct path; use batch_config with use_langextract=True")
+        if batch_mode != "online" and not batch_gcs_uri:
+            raise ValueError("batch_gcs_uri is required when batch_mode is not 'online'")
+        self.batch_mode = batch_mode
+        self.batch_threshold = batch_threshold
+        self.batch_gcs_uri = None
+        self._batch_bucket_name = None
+        self._batch_prefix = ""
+        if batch_gcs_uri:
+            if not batch_gcs_uri.startswith("gs://"):
+                raise ValueError(f"batch_gcs_uri must be a gs://bucket[/prefix] URI, got {batch_gcs_uri!r}")
+            bucket_name, _, prefix = batch_gcs_uri[len("gs://"):].rstrip("/").partition("/")
+            if not bucket_name:
+                raise ValueError(f"batch_gcs_uri must name a bucket, got {batch_gcs_uri!r}")
+            self.batch_gcs_uri = batch_gcs_uri.rstrip("/")
+            self._batch_bucket_name = bucket_name
+            self._batch_prefix = prefix
 
-    def _get_arbitrary_example(self) -> lx.data.ExampleData:
-        """Provides a high-quality example for arbitrary graph extraction, including properties."""
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _get_arbitrary_example() -> lx.data.ExampleData:
+        """
+        Provides a high-quality example for arbitrary graph extraction, including properties.
+        The example does not depend on instance configuration, so it is built once and shared.
+        """
         example_text = ("FirstEnergy (NYSE:FE), a major utilities provider, posted its earnings results on Tuesday. "
                         "The company reported $0.53 earnings per share for the quarter.")
         
-        example_json_output = json.dumps({
+        example_json_output = _json_dumps_indented({
             "extractions": [
                 {"id": "FirstEnergy", "type": "Company", "properties": {"sector": "Utilities"}},
                 {"id": "FE", "type": "StockSymbol", "properties": {}},
@@ -47,7 +234,7 @@ class LangExtractGraphTransformer:
                 {"source": "FirstEnergy", "target": "FE", "type": "HAS_STOCK_SYMBOL", "properties": {"confidence": 1.0}},
                 {"source": "FirstEnergy", "target": "$0.53", "type": "REPORTED_EARNINGS", "properties": {"quarter": "Q1"}}
             ]
-        }, indent=2)
+        })
 
         return lx.data.ExampleData(
             text=example_text,
@@ -62,19 +249,121 @@ class LangExtractGraphTransformer:
     def process_documents(self, documents: List[Document]) -> List[GraphDocument]:
         """
         Processes a list of documents to extract graph structures.
+
+        With `use_langextract=True`, multiple documents are submitted to langextract in one
+        call so their prompts are batched together, which lets the Gemini Batch API take
+        over when `batch_config` is enabled. Otherwise documents are sent directly, or as a
+        single Vertex AI batch prediction job when `batch_mode` selects it.
         """
-        example = self._get_arbitrary_example()
-        
-        results = []
-        for document in documents:
-            graph_document = self._process_single_document(document, example)
-            results.append(graph_document)
-        return results
+        if self.use_langextract and len(documents) > 1:
+            return self._process_documents_batch(documents, self._example)
+        if self._use_batch_prediction(len(documents)):
+            return self._process_documents_batch_prediction(documents)
+        if len(documents) <= 1:
+            return [self._process_single_document(document, self._example) for document in documents]
 
-    def _process_single_document(self, document: Document, example: lx.data.ExampleData) -> GraphDocument:
+        # Direct calls are independent and I/O-bound, so fan them out while preserving input order
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(documents))) as executor:
+            return list(executor.map(lambda document: self._process_single_document(document, self._example), documents))
+
+    @property
+    def _language_model(self) -> Any:
+        """The langextract model for this configuration, shared with other transformer instances."""
+        batch_config = self.model_config.get("batch")
+        return _get_language_model(
+            self.model_id,
+            self.project_id,
+            self.location,
+            tuple(sorted(batch_config.items())) if batch_config else None,
+        )
+
+    def iter_process_documents(self, documents: Iterable[Document], max_in_flight: int = 16) -> Iterator[GraphDocument]:
         """
-        Processes a single document to extract a graph structure using the 'meta-extraction' method.
+        Lazily processes documents from any iterable, yielding each GraphDocument as soon as it is
+        ready. At most `max_in_flight` documents are held in memory, and results are yielded in
+        completion order. A document whose extraction fails yields an empty GraphDocument.
+        Documents are always sent as online requests; `batch_mode` only applies to `process_documents`.
         """
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            documents_iter = iter(documents)
+            in_flight = {
+                executor.submit(self._process_single_document, document, self._example): document
+                for document in itertools.islice(documents_iter, max_in_flight)
+            }
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document = in_flight.pop(future)
+                    # Only the worker's result is guarded; exceptions thrown in at the yield must propagate
+                    try:
+                        graph_document = future.result()
+                    except Exception as e:
+                        print(f"Failed to extract graph from document: {e}")
+                        graph_document = GraphDocument(nodes=[], relationships=[], source=document)
+                    yield graph_document
+
+                    next_document = next(documents_iter, None)
+                    if next_document is not None:
+                        in_flight[executor.submit(self._process_single_document, next_document, self._example)] = next_document
+
+    async def aprocess_documents(self, documents: List[Document]) -> List[GraphDocument]:
+        """
+        Asynchronously processes documents, running up to `max_concurrency` extractions at once.
+        A document whose extraction fails yields an empty GraphDocument instead of an exception.
+        Documents are always sent as online requests; `batch_mode` only applies to `process_documents`.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        tasks = [asyncio.create_task(self._aprocess_single_document(document, self._example, semaphore)) for document in documents]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        graph_documents = []
+        for document, result in zip(documents, results):
+            if isinstance(result, Exception):
+                print(f"Failed to extract graph from document: {result}")
+                result = GraphDocument(nodes=[], relationships=[], source=document)
+            graph_documents.append(result)
+        return graph_documents
+
+    async def _aprocess_single_document(
+        self, document: Document, example: lx.data.ExampleData, semaphore: asyncio.Semaphore
+    ) -> GraphDocument:
+        """
+        Runs a single extraction under the concurrency semaphore. Direct calls use the genai
+        async client; langextract has no async API, so its blocking call is moved to a worker thread.
+        """
+        async with semaphore:
+            if self.use_langextract:
+                return await asyncio.to_thread(self._process_single_document, document, example)
+
+            # Cache reads may hit the disk, so keep them off the event loop when a cache is configured
+            graph_data = await asyncio.to_thread(self._get_cached_graph_data, document) if self.cache is not None else None
+            if graph_data is not None:
+                return self._assemble_graph(graph_data, document)
+            return await self._aextract_graph_once(document)
+
+    async def _aextract_graph_once(self, document: Document) -> GraphDocument:
+        """Async counterpart of `_extract_graph_once`, sharing the same in-flight map."""
+        key = self._cache_key(document)
+        future, is_leader = self._claim_inflight(key)
+        if not is_leader:
+            return self._assemble_graph(await asyncio.wrap_future(future), document)
+
+        try:
+            graph_data, graph_json = self._parse_model_output(await self._agenerate_graph_json(document))
+            graph_document = self._assemble_graph(graph_data, document)
+            if self.cache is not None:
+                await asyncio.to_thread(self._cache_graph_json, document, graph_json)
+            future.set_result(graph_data)
+            return graph_document
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release_inflight(key)
+
+    def _build_prompt(self) -> str:
+        """Builds the prompt description shared by every extraction call."""
         prompt = """
         You are an expert at building knowledge graphs. 
         From the provided text, extract all meaningful entities as nodes and the relationships between them.
@@ -88,58 +377,505 @@ class LangExtractGraphTransformer:
             prompt += f"\nFor nodes, you should extract the following properties when available: {self.node_properties}"
         if self.relationship_properties:
             prompt += f"\nFor relationships, you should extract the following properties when available: {self.relationship_properties}"
+        return prompt
+
+    def _build_direct_prompt(self) -> str:
+        """Builds the static prompt prefix for direct calls by appending the meta example to the prompt."""
+        return (
+            f"{self._prompt}\n"
+            f"\nExample text:\n---\n{self._example.text}\n---"
+            f"\nExample output:\n{self._example.extractions[0].extraction_text}"
+        )
+
+    def _process_documents_batch(self, documents: List[Document], example: lx.data.ExampleData) -> List[GraphDocument]:
+        """
+        Processes several documents with a single langextract call and maps the
+        annotated results back to their source documents in input order. Documents
+        already in the cache are not sent to the model, and duplicates are sent once.
+        """
+        graph_documents = self._get_cached_graph_documents(documents)
+        pending = self._group_pending_documents(documents, graph_documents)
+        lx_documents = [
+            lx.data.Document(text=documents[index].page_content, document_id=str(index))
+            for index in pending
+        ]
+
+        if lx_documents:
+            annotated_documents = lx.extract(
+                text_or_documents=lx_documents,
+                prompt_description=self._prompt,
+                examples=[example],
+                model=self._language_model,
+                use_schema_constraints=False, # The shared model already carries the example schema
+                batch_length=self.batch_length,
+            )
+            for annotated in annotated_documents:
+                try:
+                    indices = pending[int(annotated.document_id)]
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Skipping annotated document with an unknown id: {e!r}")
+                    continue
+                self._fill_pending_group(documents, graph_documents, indices, self._get_graph_json(annotated.extractions))
+
+        return self._fill_missing_graph_documents(documents, graph_documents)
+
+    def _get_cached_graph_documents(self, documents: List[Document]) -> List[Optional[GraphDocument]]:
+        """Assembles the GraphDocument of every cached document, leaving None for the uncached ones."""
+        graph_documents = []
+        for document in documents:
+            graph_data = self._get_cached_graph_data(document)
+            graph_documents.append(None if graph_data is None else self._assemble_graph(graph_data, document))
+        return graph_documents
+
+    @staticmethod
+    def _fill_missing_graph_documents(
+        documents: List[Document], graph_documents: List[Optional[GraphDocument]]
+    ) -> List[GraphDocument]:
+        """Replaces the documents no result was assembled for with empty GraphDocuments."""
+        return [
+            graph_document if graph_document is not None else GraphDocument(nodes=[], relationships=[], source=document)
+            for graph_document, document in zip(graph_documents, documents)
+        ]
+
+    @staticmethod
+    def _group_pending_documents(
+        documents: List[Document], graph_documents: List[Optional[GraphDocument]]
+    ) -> Dict[int, List[int]]:
+        """
+        Groups uncached documents by identical page content, mapping the first index of each
+        group to all of its indices, so repeated texts in a batch are only sent to the model once.
+        """
+        first_index_by_text: Dict[str, int] = {}
+        groups: Dict[int, List[int]] = {}
+        for index, (document, graph_document) in enumerate(zip(documents, graph_documents)):
+            if graph_document is not None:
+                continue
+            first_index = first_index_by_text.setdefault(document.page_content, index)
+            groups.setdefault(first_index, []).append(index)
+        return groups
+
+    def _fill_pending_group(
+        self,
+        documents: List[Document],
+        graph_documents: List[Optional[GraphDocument]],
+        indices: List[int],
+        graph_json: Optional[str],
+    ) -> None:
+        """
+        Assembles one extraction result for every document in a duplicate group, caching it once
+        the whole group has assembled. A result that fails to assemble leaves the group unfilled,
+        so one bad output does not discard the rest of the batch.
+        """
+        graph_data, graph_json = self._parse_model_output(graph_json)
+        try:
+            group = [self._assemble_graph(graph_data, documents[index]) for index in indices]
+        except Exception as e:
+            print(f"Failed to extract graph from document: {e}")
+            return
+        for index, graph_document in zip(indices, group):
+            graph_documents[index] = graph_document
+        self._cache_graph_json(documents[indices[0]], graph_json)
 
-        result = lx.extract(
-            text_or_documents=document.page_content,
-            prompt_description=prompt,
-            examples=[example], # The 'meta' example guides the LLM
-            model_id=self.model_id,
-            language_model_params=self.model_config,
+    def _use_batch_prediction(self, num_documents: int) -> bool:
+        """Whether a direct-path call with `num_documents` documents goes through batch prediction."""
+        if self.use_langextract or num_documents == 0:
+            return False
+        if self.batch_mode == "auto":
+            return num_documents >= self.batch_threshold
+        return self.batch_mode == "batch"
+
+    def _process_documents_batch_prediction(self, documents: List[Document]) -> List[GraphDocument]:
+        """
+        Processes documents with one Vertex AI batch prediction job. Requests are written as
+        JSONL to GCS, the job is polled with exponential backoff, and the output JSONL is
+        mapped back to the source documents through a per-request label.
+        """
+        try:
+            from google.cloud import storage
+        except ImportError as e:
+            raise ImportError(
+                "google-cloud-storage is required for batch prediction. "
+                "Install it with: pip install google-cloud-storage"
+            ) from e
+
+        graph_documents = self._get_cached_graph_documents(documents)
+        pending = self._group_pending_documents(documents, graph_documents)
+
+        if pending:
+            run_name = f"graph-extract-{uuid.uuid4().hex}"
+            run_prefix = f"{self._batch_prefix}/{run_name}" if self._batch_prefix else run_name
+            run_uri = f"gs://{self._batch_bucket_name}/{run_prefix}"
+            bucket = storage.Client(project=self.project_id).bucket(self._batch_bucket_name)
+
+            request_lines = [
+                _json_dumps({
+                    "request": {
+                        "contents": self._build_contents(documents[index]),
+                        "generation_config": {"response_mime_type": "application/json"},
+                        "labels": {"document_index": str(index)},
+                    }
+                })
+                for index in pending
+            ]
+            bucket.blob(f"{run_prefix}/input.jsonl").upload_from_string(
+                "\n".join(request_lines), content_type="application/jsonl"
+            )
+
+            job = self._client.batches.create(
+                model=self.model_id,
+                src=f"{run_uri}/input.jsonl",
+                config=types.CreateBatchJobConfig(display_name="graph-extract", dest=f"{run_uri}/output"),
+            )
+            job = self._wait_for_batch_job(job)
+
+            for blob in bucket.list_blobs(prefix=f"{run_prefix}/output"):
+                if not blob.name.endswith(".jsonl"):
+                    continue
+                for line in blob.download_as_text().splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        output = _json_loads(line)
+                        indices = pending[int(output["request"]["labels"]["document_index"])]
+                        response_text = self._get_response_text(output.get("response"))
+                    except (ValueError, KeyError, TypeError, AttributeError) as e:
+                        print(f"Skipping unreadable batch prediction output line: {e!r}")
+                        continue
+                    self._fill_pending_group(documents, graph_documents, indices, response_text)
+
+        return self._fill_missing_graph_documents(documents, graph_documents)
+
+    def _wait_for_batch_job(self, job: Any) -> Any:
+        """Polls a batch job with exponential backoff until it finishes, raising if it did not succeed."""
+        delay = _BATCH_POLL_INITIAL_SECONDS
+        while job.state.name not in _BATCH_TERMINAL_STATES:
+            time.sleep(delay)
+            delay = min(delay * 2, _BATCH_POLL_MAX_SECONDS)
+            job = self._client.batches.get(name=job.name)
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch job {job.name} finished with state {job.state.name}: {job.error}")
+        return job
+
+    @staticmethod
+    def _get_response_text(response: Optional[dict]) -> Optional[str]:
+        """Returns the text of the first candidate in a batch prediction output response."""
+        candidates = (response or {}).get("candidates") or []
+        if not candidates:
+            return None
+        parts = candidates[0].get("content", {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts) or None
+
+    def _process_single_document(self, document: Document, example: lx.data.ExampleData) -> GraphDocument:
+        """
+        Processes a single document to extract a graph structure using the 'meta-extraction' method.
+        """
+        graph_data = self._get_cached_graph_data(document)
+        if graph_data is not None:
+            return self._assemble_graph(graph_data, document)
+        return self._extract_graph_once(document, example)
+
+    def _extract_graph_once(self, document: Document, example: lx.data.ExampleData) -> GraphDocument:
+        """
+        Extracts the graph for a document, coalescing concurrent requests for the same cache key
+        into a single model call. Every caller assembles its own GraphDocument from the shared
+        parsed items, so no graph objects are shared between callers. The model output is only
+        cached once it has parsed and assembled.
+        """
+        key = self._cache_key(document)
+        future, is_leader = self._claim_inflight(key)
+        if not is_leader:
+            return self._assemble_graph(future.result(), document)
+
+        try:
+            graph_data, graph_json = self._parse_model_output(self._extract_graph_json(document, example))
+            graph_document = self._assemble_graph(graph_data, document)
+            self._cache_graph_json(document, graph_json)
+            future.set_result(graph_data)
+            return graph_document
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release_inflight(key)
+
+    def _claim_inflight(self, key: str) -> Tuple[Future, bool]:
+        """Returns the in-flight Future for `key`, registering a new one if the caller is the first."""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _release_inflight(self, key: str) -> None:
+        """Removes a settled in-flight entry."""
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+
+    def _extract_graph_json(self, document: Document, example: lx.data.ExampleData) -> Optional[str]:
+        """Calls the configured extraction path for a single document and returns its raw GraphJSON."""
+        if self.use_langextract:
+            result = lx.extract(
+                text_or_documents=document.page_content,
+                prompt_description=self._prompt,
+                examples=[example], # The 'meta' example guides the LLM
+                model=self._language_model,
+                use_schema_constraints=False, # The shared model already carries the example schema
+            )
+            return self._get_graph_json(result.extractions)
+        return self._generate_graph_json(document)
+
+    def _generate_graph_json(self, document: Document) -> Optional[str]:
+        """
+        Calls the model directly and returns its JSON response text. The static prompt and the
+        document are sent as separate parts so the prompt prefix stays cacheable. When a context
+        cache is active, only the document part is sent.
+        """
+        response = self._generate_content(*self._build_request(document, self._get_context_cached_config()))
+        return response.text
+
+    async def _agenerate_graph_json(self, document: Document) -> Optional[str]:
+        """Async counterpart of `_generate_graph_json` using the genai async client."""
+        # Creating or refreshing the context cache is a blocking call, so only leave the loop when it is used
+        cached_config = await asyncio.to_thread(self._get_context_cached_config) if self._use_context_cache() else None
+        response = await self._agenerate_content(*self._build_request(document, cached_config))
+        return response.text
+
+    def _build_request(
+        self, document: Document, cached_config: Optional[types.GenerateContentConfig]
+    ) -> Tuple[List[dict], types.GenerateContentConfig]:
+        """Returns the contents and config for a direct call, omitting the prompt when it is context-cached."""
+        if cached_config is None:
+            return self._build_contents(document), self._generation_config
+        return [{"role": "user", "parts": [self._document_part(document)]}], cached_config
+
+    @retry(
+        retry=retry_if_exception(_is_transient_error),
+        wait=wait_exponential(multiplier=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    def _generate_content(self, contents: List[dict], config: types.GenerateContentConfig) -> Any:
+        """
+        Issues a direct generate_content call, retrying rate-limit and transient server errors
+        with exponential backoff. The request gate caps in-flight calls across all entry points.
+        """
+        with self._request_gate:
+            return self._client.models.generate_content(
+                model=self.model_id,
+                contents=contents,
+                config=config,
+            )
+
+    @retry(
+        retry=retry_if_exception(_is_transient_error),
+        wait=wait_exponential(multiplier=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    async def _agenerate_content(self, contents: List[dict], config: types.GenerateContentConfig) -> Any:
+        """
+        Async counterpart of `_generate_content`. Concurrency is bounded by the caller's asyncio
+        semaphore rather than the thread-based request gate, which would block the event loop.
+        """
+        return await self._client.aio.models.generate_content(
+            model=self.model_id,
+            contents=contents,
+            config=config,
         )
 
-        nodes = []
-        relationships = []
-        if result.extractions and result.extractions[0].extraction_text:
-            try:
-                graph_json_string = result.extractions[0].extraction_text
-                graph_data_obj = json.loads(graph_json_string)
-                
-                # Handle both dict and list outputs from the LLM
-                if isinstance(graph_data_obj, dict):
-                    graph_data = graph_data_obj.get("extractions", [])
-                elif isinstance(graph_data_obj, list):
-                    graph_data = graph_data_obj
-                else:
-                    graph_data = []
-                
-                node_map = {}
-                for item in graph_data:
-                    if "source" not in item and "id" in item and "type" in item:
-                        node_id = item["id"]
-                        if node_id not in node_map:
-                            node = Node(
-                                id=node_id,
-                                type=item["type"],
-                                properties={f"prop_{str(k).lower()}": str(v) for k, v in item.get("properties", {}).items()}
-                            )
-                            nodes.append(node)
-                            node_map[node_id] = node
-                
-                for item in graph_data:
-                    if "source" in item and "target" in item and "type" in item:
-                        source_node = node_map.get(item["source"])
-                        target_node = node_map.get(item["target"])
-                        if source_node and target_node:
-                            relationships.append(
-                                Relationship(
-                                    source=source_node,
-                                    target=target_node,
-                                    type=item["type"],
-                                    properties={f"prop_{str(k).lower()}": str(v) for k, v in item.get("properties", {}).items()}
-                                )
-                            )
-            except (json.JSONDecodeError, IndexError) as e:
-                print(f"Failed to parse graph from document: {e}")
-                pass
-
-        return GraphDocument(nodes=nodes, relationships=relationships, source=document)
+    def _use_context_cache(self) -> bool:
+        """Whether requests should go through a context cache of the static prompt."""
+        return bool(self.context_cache_ttl_seconds) and not self._context_cache_disabled
+
+    @retry(
+        retry=retry_if_exception(_is_transient_error),
+        wait=wait_exponential(multiplier=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    def _create_context_cache(self) -> Any:
+        """Creates the context cache holding the static prompt, retrying transient errors."""
+        return self._client.caches.create(
+            model=self.model_id,
+            config=types.CreateCachedContentConfig(
+                contents=[{"role": "user", "parts": [{"text": self._direct_prompt}]}],
+                display_name="graph-extract-prompt",
+                ttl=f"{self.context_cache_ttl_seconds}s",
+            ),
+        )
+
+    def _get_context_cached_config(self) -> Optional[types.GenerateContentConfig]:
+        """
+        Returns a generation config pointing at a Vertex AI context cache holding the static prompt,
+        creating or refreshing the cache as needed. Returns None when context caching is disabled or
+        the cache could not be created (e.g. the prompt is below the model's minimum cacheable size).
+        """
+        if not self._use_context_cache():
+            return None
+        with self._context_cache_lock:
+            if self._context_cache_disabled:
+                return None
+            if self._context_cached_config is None or time.monotonic() >= self._context_cache_expires_at:
+                try:
+                    cached_content = self._create_context_cache()
+                except genai_errors.APIError as e:
+                    print(f"Failed to create context cache, sending the prompt inline instead: {e}")
+                    # A 400 means the request itself is unacceptable (typically the prompt is below the
+                    # minimum cacheable size) and will never succeed; anything else is retried next call
+                    if e.code == 400:
+                        self._context_cache_disabled = True
+                    self._context_cached_config = None
+                    return None
+                self._context_cached_config = self._generation_config.model_copy(
+                    update={"cached_content": cached_content.name}
+                )
+                # Refresh a little before the server-side expiry so requests never reference a dead cache
+                refresh_margin = min(_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS, self.context_cache_ttl_seconds / 2)
+                self._context_cache_expires_at = time.monotonic() + self.context_cache_ttl_seconds - refresh_margin
+            return self._context_cached_config
+
+    def _build_contents(self, document: Document) -> List[dict]:
+        """Builds the request contents for a direct call."""
+        return [{
+            "role": "user",
+            "parts": [
+                {"text": self._direct_prompt},
+                self._document_part(document),
+            ],
+        }]
+
+    @staticmethod
+    def _document_part(document: Document) -> dict:
+        """Builds the per-document content part that follows the static prompt."""
+        return {"text": f"\n\nText to process:\n---\n{document.page_content}\n---"}
+
+    def _cache_key(self, document: Document) -> str:
+        """
+        Keys a document by provider, model, prompt version, requested properties and content,
+        so any change to how the graph would be extracted misses the cache.
+        """
+        key_hash = self._cache_key_hash.copy()
+        key_hash.update(_length_prefixed(document.page_content.encode("utf-8")))
+        return key_hash.hexdigest()
+
+    def _get_cached_graph_data(self, document: Document) -> Optional[List[dict]]:
+        """
+        Returns the parsed graph items cached for a document, if caching is enabled and it is present.
+        Entries that no longer parse into graph items are evicted so the document is extracted again.
+        """
+        if self.cache is None:
+            return None
+        key = self._cache_key(document)
+        graph_json = self.cache.get(key)
+        if graph_json is None:
+            return None
+        try:
+            return self._parse_graph_data(graph_json)
+        except ValueError:
+            self.cache.pop(key, None)
+            return None
+
+    def _cache_graph_json(self, document: Document, graph_json: Optional[str]) -> None:
+        """Stores a GraphJSON string for a document when caching is enabled."""
+        if self.cache is None or not graph_json:
+            return
+        if isinstance(self.cache, ExtractionCache):
+            self.cache.put(self._cache_key(document), graph_json, model=self.model_id)
+        else:
+            self.cache[self._cache_key(document)] = graph_json
+
+    @staticmethod
+    def _get_graph_json(extractions: Optional[List[lx.data.Extraction]]) -> Optional[str]:
+        """Returns the GraphJSON string from a meta-extraction result, if any."""
+        if not extractions or not extractions[0].extraction_text:
+            return None
+        return extractions[0].extraction_text
+
+    @staticmethod
+    def _parse_graph_data(graph_json: Optional[str]) -> List[dict]:
+        """
+        Parses the GraphJSON meta-extraction into a flat list of node and relationship items.
+        Raises ValueError when it is not JSON or not a list of item objects; a `properties`
+        value that is not an object is replaced with an empty one.
+        """
+        if not graph_json:
+            return []
+
+        graph_data_obj = _json_loads(graph_json)
+        # Handle both dict and list outputs from the LLM
+        if isinstance(graph_data_obj, dict):
+            graph_data_obj = graph_data_obj.get("extractions")
+        if not isinstance(graph_data_obj, list) or not all(isinstance(item, dict) for item in graph_data_obj):
+            raise ValueError("GraphJSON must be a list of extraction objects")
+        return [
+            item if isinstance(item.get("properties", {}), dict) else {**item, "properties": {}}
+            for item in graph_data_obj
+        ]
+
+    def _parse_model_output(self, graph_json: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+        """
+        Parses a raw model answer, returning its graph items and the raw text worth caching.
+        An answer that does not parse yields no items and nothing to cache.
+        """
+        try:
+            return self._parse_graph_data(graph_json), graph_json
+        except ValueError as e:
+            print(f"Failed to parse graph from document: {e}")
+            return [], None
+
+    def _assemble_graph(self, graph_data: List[dict], document: Document) -> GraphDocument:
+        """
+        Builds a GraphDocument from parsed graph items. Relationships whose source
+        or target was not extracted as a node are dropped. When `node_properties` or
+        `relationship_properties` were given, only those properties are kept.
+        """
+        # Hoist per-instance lookups out of the per-item loop
+        normalize = self._normalize_properties
+        allowed_node_keys = self._allowed_node_keys
+        allowed_relationship_keys = self._allowed_relationship_keys
+
+        node_map = {}
+        pending_relationships = []
+        # Single pass over the items: index nodes and defer relationships until every node is known
+        for item in graph_data:
+            if "source" in item:
+                pending_relationships.append(item)
+            elif "id" in item and "type" in item and item["id"] not in node_map:
+                node_map[item["id"]] = Node(
+                    id=item["id"],
+                    type=item["type"],
+                    properties=normalize(item.get("properties"), allowed_node_keys)
+                )
+
+        relationships = [
+            Relationship(
+                source=node_map[item["source"]],
+                target=node_map[item["target"]],
+                type=item["type"],
+                properties=normalize(item.get("properties"), allowed_relationship_keys)
+            )
+            for item in pending_relationships
+            if "type" in item and item["source"] in node_map and item.get("target") in node_map
+        ]
+
+        # dicts preserve insertion order, so nodes keep the order they were extracted in
+        return GraphDocument(nodes=list(node_map.values()), relationships=relationships, source=document)
+
+    @staticmethod
+    def _normalize_properties(properties: Optional[dict], allowed_keys: FrozenSet[str] = frozenset()) -> dict:
+        """
+        Normalizes property keys for Spanner compatibility (see `_normalize_property_key`). Values
+        keep the JSON types the model returned; when two keys normalize alike the first value wins.
+        A non-empty `allowed_keys` set of normalized keys drops every other property.
+        """
+        if not properties:
+            return {}
+        normalized = {}
+        for k, v in properties.items():
+            key = _normalize_property_key(k)
+            if allowed_keys and key not in allowed_keys:
+                continue
+            normalized.setdefault(key, v)
+        return normalized
@@ -10,6 +10,10 @@ from langchain_community.graphs.graph_document import GraphDocument
 # Load environment variables from .env file
 load_dotenv()
 
+def by_id(nodes):
+    """Indexes nodes by id for O(1) lookups in assertions."""
+    return {n.id: n for n in nodes}
+
 class TestLangExtractGraphTransformerIntegration(unittest.TestCase):
 
     def test_arbitrary_extraction_with_properties(self):
@@ -44,13 +48,17 @@ class TestLangExtractGraphTransformerIntegration(unittest.TestCase):
         self.assertGreater(len(graph_document.relationships), 0, "No relationships were extracted.")
 
         # Find the FirstEnergy node and check for its sector property
-        first_energy_node = next((n for n in graph_document.nodes if n.id == "FirstEnergy"), None)
+        nodes_by_id = by_id(graph_document.nodes)
+        # Reversed so the first relationship of each type wins, as with a linear search
+        rels_by_type = {r.type: r for r in reversed(graph_document.relationships)}
+
+        first_energy_node = nodes_by_id.get("FirstEnergy")
         self.assertIsNotNone(first_energy_node, "FirstEnergy node not found.")
         self.assertIn("prop_sector", first_energy_node.properties, "'prop_sector' property missing from FirstEnergy node.")
         self.assertIsNotNone(first_energy_node.properties.get("prop_sector"), "'prop_sector' property should have a value.")
 
         # Find the REPORTED_EARNINGS relationship and check for its quarter property
-        reported_earnings_rel = next((r for r in graph_document.relationships if r.type == "REPORTED_EARNINGS"), None)
+        reported_earnings_rel = rels_by_type.get("REPORTED_EARNINGS")
         self.assertIsNotNone(reported_earnings_rel, "REPORTED_EARNINGS relationship not found.")
         self.assertIn("prop_quarter", reported_earnings_rel.properties, "'prop_quarter' property missing from REPORTED_EARNINGS relationship.")
         self.assertIsNotNone(reported_earnings_rel.properties.get("prop_quarter"), "'prop_quarter' property should have a value.")
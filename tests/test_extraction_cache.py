@@ -0,0 +1,77 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from langextract_graph_transformers._cache import ExtractionCache
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_put_and_get_round_trip(self):
+        # Arrange
+        cache = ExtractionCache(self.cache_dir)
+
+        # Act
+        cache.put("abc", '{"extractions": []}', model="gemini-2.5-pro")
+
+        # Assert
+        self.assertEqual(cache.get("abc"), '{"extractions": []}')
+        self.assertEqual(cache["abc"], '{"extractions": []}')
+        self.assertIn("abc", cache)
+        self.assertEqual(len(cache), 1)
+        with open(self.cache_dir / "abc.json", encoding="utf-8") as f:
+            record = json.load(f)
+        self.assertEqual(record["model"], "gemini-2.5-pro")
+        self.assertIn("ts", record)
+
+    def test_missing_and_deleted_keys(self):
+        # Arrange
+        cache = ExtractionCache(self.cache_dir)
+        cache["abc"] = "[]"
+
+        # Act
+        del cache["abc"]
+
+        # Assert
+        self.assertIsNone(cache.get("abc"))
+        self.assertIsNone(cache.pop("abc", None))
+        with self.assertRaises(KeyError):
+            cache["abc"]
+
+    def test_pop_tolerates_a_concurrent_removal(self):
+        # Arrange
+        cache = ExtractionCache(self.cache_dir)
+        cache["abc"] = "[]"
+        other = ExtractionCache(self.cache_dir)
+        real_get = cache.get
+
+        def get_then_lose_race(key, default=None):
+            raw = real_get(key, default)
+            other.pop(key, None)
+            return raw
+
+        cache.get = get_then_lose_race
+
+        # Act / Assert
+        self.assertEqual(cache.pop("abc", None), "[]")
+        self.assertNotIn("abc", other)
+        with self.assertRaises(KeyError):
+            cache.pop("abc")
+
+    def test_unreadable_entry_is_treated_as_missing(self):
+        # Arrange
+        cache = ExtractionCache(self.cache_dir)
+        (self.cache_dir / "abc.json").write_text("not json", encoding="utf-8")
+
+        # Act / Assert
+        self.assertIsNone(cache.get("abc"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,28 @@
 
+import asyncio
+import math
+import tempfile
+import threading
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
 from langchain_core.documents import Document
-from langextract_graph_transformers.langextract_graph_transformer import LangExtractGraphTransformer
+from langextract_graph_transformers.langextract_graph_transformer import LangExtractGraphTransformer, _get_client, _get_language_model
 from langchain_community.graphs.graph_document import GraphDocument
 import langextract as lx
+from google.genai import errors as genai_errors
+
+def by_id(nodes):
+    """Indexes nodes by id for O(1) lookups in assertions."""
+    return {n.id: n for n in nodes}
 
 class TestLangExtractGraphTransformer(unittest.TestCase):
 
     def setUp(self):
         self.project_id = "test-project"
         self.location = "test-location"
+        _get_client.cache_clear()
+        _get_language_model.cache_clear()
 
     @patch('langextract.extract')
     def test_extraction_with_properties(self, mock_extract):
@@ -19,6 +30,7 @@ class TestLangExtractGraphTransformer(unittest.TestCase):
         transformer = LangExtractGraphTransformer(
             project_id=self.project_id,
             location=self.location,
+            use_langextract=True,
             node_properties=["sector"],
             relationship_properties=["confidence"]
         )
@@ -58,15 +70,15 @@ class TestLangExtractGraphTransformer(unittest.TestCase):
         self.assertEqual(len(graph_document.relationships), 1)
 
         # Find the FirstEnergy node and check its properties
-        first_energy_node = next((n for n in graph_document.nodes if n.id == "FirstEnergy"), None)
+        first_energy_node = by_id(graph_document.nodes).get("FirstEnergy")
         self.assertIsNotNone(first_energy_node)
-        # Verify that the property key is normalized and the value is a string
+        # Verify that the property key is normalized
         self.assertEqual(first_energy_node.properties.get('prop_sector'), "Utilities")
 
         # Check relationship properties
         relationship = graph_document.relationships[0]
-        # Verify that the property key is normalized and the value is a string
-        self.assertEqual(relationship.properties.get('prop_confidence'), "0.9")
+        # Verify that the property key is normalized and the numeric value keeps its type
+        self.assertEqual(relationship.properties.get('prop_confidence'), 0.9)
 
     @patch('langextract.extract')
     def test_extraction_handles_raw_list_output(self, mock_extract):
@@ -74,6 +86,7 @@ class TestLangExtractGraphTransformer(unittest.TestCase):
         transformer = LangExtractGraphTransformer(
             project_id=self.project_id,
             location=self.location,
+            use_langextract=True,
         )
         doc_content = "Apple is a company."
         document = Document(page_content=doc_content)
@@ -108,5 +121,782 @@ class TestLangExtractGraphTransformer(unittest.TestCase):
         self.assertEqual(graph_document.nodes[0].id, "Apple")
         self.assertEqual(graph_document.nodes[0].type, "Company")
 
+    @patch('langextract.factory.create_model')
+    @patch('langextract.extract')
+    def test_multiple_documents_are_batched_into_one_call(self, mock_extract, mock_create_model):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+            batch_config={"enabled": True, "threshold": 2, "enable_caching": False, "retention_days": 1},
+        )
+        documents = [Document(page_content="Apple is a company."), Document(page_content="Google is a company.")]
+
+        def annotated(document_id, node_id):
+            annotated_document = MagicMock()
+            annotated_document.document_id = document_id
+            annotated_document.extractions = [
+                lx.data.Extraction(
+                    extraction_class="GraphJSON",
+                    extraction_text=json.dumps([{"id": node_id, "type": "Company", "properties": {}}])
+                )
+            ]
+            return annotated_document
+
+        # Return the annotated documents out of order to check they are mapped back by id
+        mock_extract.return_value = [annotated("1", "Google"), annotated("0", "Apple")]
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        mock_extract.assert_called_once()
+        lx_documents = mock_extract.call_args.kwargs["text_or_documents"]
+        self.assertEqual([d.text for d in lx_documents], [d.page_content for d in documents])
+        self.assertIs(mock_extract.call_args.kwargs["model"], mock_create_model.return_value)
+        self.assertEqual(mock_create_model.call_args.kwargs["config"].provider_kwargs["batch"]["threshold"], 2)
+
+        self.assertEqual(len(graph_documents), 2)
+        self.assertEqual(graph_documents[0].nodes[0].id, "Apple")
+        self.assertIs(graph_documents[0].source, documents[0])
+        self.assertEqual(graph_documents[1].nodes[0].id, "Google")
+        self.assertIs(graph_documents[1].source, documents[1])
+
+    @patch('langextract.factory.create_model')
+    @patch('langextract.extract')
+    def test_one_bad_annotated_document_does_not_fail_the_batch(self, mock_extract, mock_create_model):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+        )
+        documents = [Document(page_content=name) for name in ["Apple", "Google", "Microsoft"]]
+
+        def annotated(document_id, graph):
+            annotated_document = MagicMock()
+            annotated_document.document_id = document_id
+            annotated_document.extractions = [
+                lx.data.Extraction(extraction_class="GraphJSON", extraction_text=json.dumps(graph))
+            ]
+            return annotated_document
+
+        mock_extract.return_value = [
+            annotated(None, [{"id": "Unknown", "type": "Company"}]),
+            annotated("0", [{"id": "Apple", "type": "Company", "properties": {}}]),
+            annotated("1", {"extractions": None}),
+            annotated("2", [{"id": {"name": "Microsoft"}, "type": "Company"}]),
+        ]
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        self.assertEqual([[node.id for node in graph.nodes] for graph in graph_documents], [["Apple"], [], []])
+        self.assertEqual([graph.source for graph in graph_documents], documents)
+
+    @patch('langextract.extract')
+    def test_aprocess_documents_maps_failures_to_empty_graphs(self, mock_extract):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+            max_concurrency=2,
+        )
+        documents = [Document(page_content="Apple is a company."), Document(page_content="broken")]
+
+        def fake_extract(text_or_documents, **kwargs):
+            if text_or_documents == "broken":
+                raise RuntimeError("model unavailable")
+            result = MagicMock()
+            result.extractions = [
+                lx.data.Extraction(
+                    extraction_class="GraphJSON",
+                    extraction_text=json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+                )
+            ]
+            return result
+
+        mock_extract.side_effect = fake_extract
+
+        # Act
+        graph_documents = asyncio.run(transformer.aprocess_documents(documents))
+
+        # Assert
+        self.assertEqual(mock_extract.call_count, 2)
+        self.assertEqual(len(graph_documents), 2)
+        self.assertEqual(graph_documents[0].nodes[0].id, "Apple")
+        self.assertEqual(graph_documents[1].nodes, [])
+        self.assertIs(graph_documents[1].source, documents[1])
+
+    @patch('langextract.factory.create_model')
+    @patch('langextract.extract')
+    def test_language_model_is_shared_across_instances(self, mock_extract, mock_create_model):
+        # Arrange
+        mock_extraction_result = MagicMock()
+        mock_extraction_result.extractions = []
+        mock_extract.return_value = mock_extraction_result
+        transformers = [
+            LangExtractGraphTransformer(project_id=self.project_id, location=self.location, use_langextract=True)
+            for _ in range(2)
+        ]
+
+        # Act
+        for transformer in transformers:
+            transformer.process_documents([Document(page_content="Apple is a company.")])
+
+        # Assert
+        mock_create_model.assert_called_once()
+        for call in mock_extract.call_args_list:
+            self.assertIs(call.kwargs["model"], mock_create_model.return_value)
+
+    @patch('langextract.extract')
+    def test_iter_process_documents_streams_from_a_generator(self, mock_extract):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+        )
+
+        def fake_extract(text_or_documents, **kwargs):
+            result = MagicMock()
+            result.extractions = [
+                lx.data.Extraction(
+                    extraction_class="GraphJSON",
+                    extraction_text=json.dumps([{"id": text_or_documents, "type": "Company", "properties": {}}])
+                )
+            ]
+            return result
+
+        mock_extract.side_effect = fake_extract
+        documents = (Document(page_content=name) for name in ["Apple", "Google", "Microsoft"])
+
+        # Act
+        graph_documents = list(transformer.iter_process_documents(documents, max_in_flight=2))
+
+        # Assert
+        self.assertEqual(mock_extract.call_count, 3)
+        self.assertEqual(
+            sorted(graph.nodes[0].id for graph in graph_documents),
+            ["Apple", "Google", "Microsoft"],
+        )
+        for graph in graph_documents:
+            self.assertEqual(graph.source.page_content, graph.nodes[0].id)
+
+    @patch('langextract.extract')
+    def test_iter_process_documents_propagates_consumer_exceptions(self, mock_extract):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+        )
+        mock_extract.return_value.extractions = [
+            lx.data.Extraction(
+                extraction_class="GraphJSON",
+                extraction_text=json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+            )
+        ]
+        stream = transformer.iter_process_documents([Document(page_content="Apple"), Document(page_content="Google")])
+        next(stream)
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            stream.throw(ValueError("consumer error"))
+
+    @patch('langextract.extract')
+    def test_cache_skips_repeated_extractions(self, mock_extract):
+        # Arrange
+        cache = {}
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+            cache=cache,
+        )
+        mock_extraction_result = MagicMock()
+        mock_extraction_result.extractions = [
+            lx.data.Extraction(
+                extraction_class="GraphJSON",
+                extraction_text=json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+            )
+        ]
+        mock_extract.return_value = mock_extraction_result
+
+        # Act
+        first = transformer.process_documents([Document(page_content="Apple is a company.")])
+        second = transformer.process_documents([Document(page_content="Apple is a company.")])
+
+        # Assert
+        mock_extract.assert_called_once()
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(first[0].nodes, second[0].nodes)
+        self.assertIsNot(first[0].nodes[0], second[0].nodes[0])
+
+    @patch('google.genai.Client')
+    def test_direct_extraction_uses_json_response(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps({
+            "extractions": [
+                {"id": "Microsoft", "type": "Company", "properties": {"location": "Redmond"}},
+                {"id": "Activision Blizzard", "type": "Company", "properties": {}},
+                {"source": "Microsoft", "target": "Activision Blizzard", "type": "ACQUIRED", "properties": {}}
+            ]
+        })
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            node_properties=["location"],
+        )
+        document = Document(page_content="Microsoft, headquartered in Redmond, acquired Activision Blizzard.")
+
+        # Act
+        graph_documents = transformer.process_documents([document])
+
+        # Assert
+        mock_client_cls.assert_called_once_with(vertexai=True, project=self.project_id, location=self.location)
+        call_kwargs = mock_client_cls.return_value.models.generate_content.call_args.kwargs
+        self.assertEqual(call_kwargs["model"], "gemini-2.5-pro")
+        self.assertEqual(call_kwargs["config"].response_mime_type, "application/json")
+        prompt_part, document_part = call_kwargs["contents"][0]["parts"]
+        self.assertIn("HAS_STOCK_SYMBOL", prompt_part["text"])
+        self.assertIn(document.page_content, document_part["text"])
+
+        graph_document = graph_documents[0]
+        self.assertEqual(len(graph_document.nodes), 2)
+        self.assertEqual(graph_document.nodes[0].properties, {"prop_location": "Redmond"})
+        self.assertEqual(graph_document.relationships[0].type, "ACQUIRED")
+
+    @patch('time.sleep')
+    @patch('google.cloud.storage.Client')
+    @patch('google.genai.Client')
+    def test_batch_prediction_maps_outputs_back_to_documents(self, mock_client_cls, mock_storage_cls, mock_sleep):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            batch_mode="auto",
+            batch_threshold=2,
+            batch_gcs_uri="gs://test-bucket/graphs/",
+        )
+        documents = [Document(page_content="Apple is a company."), Document(page_content="Google is a company.")]
+
+        running_job = MagicMock()
+        running_job.name = "batches/123"
+        running_job.state.name = "JOB_STATE_RUNNING"
+        succeeded_job = MagicMock()
+        succeeded_job.name = "batches/123"
+        succeeded_job.state.name = "JOB_STATE_SUCCEEDED"
+        mock_client = mock_client_cls.return_value
+        mock_client.batches.create.return_value = running_job
+        mock_client.batches.get.return_value = succeeded_job
+
+        def output_line(index, node_id):
+            graph = json.dumps([{"id": node_id, "type": "Company", "properties": {}}])
+            return json.dumps({
+                "request": {"labels": {"document_index": str(index)}},
+                "response": {"candidates": [{"content": {"parts": [{"text": graph}]}}]},
+            })
+
+        output_blob = MagicMock()
+        output_blob.name = "graphs/run/output/predictions.jsonl"
+        # Output order is not guaranteed, so return the lines reversed
+        output_blob.download_as_text.return_value = "\n".join([output_line(1, "Google"), output_line(0, "Apple")])
+        mock_bucket = mock_storage_cls.return_value.bucket.return_value
+        mock_bucket.list_blobs.return_value = [output_blob]
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        mock_storage_cls.return_value.bucket.assert_called_once_with("test-bucket")
+        uploaded = mock_bucket.blob.return_value.upload_from_string.call_args.args[0].splitlines()
+        self.assertEqual(len(uploaded), 2)
+        self.assertEqual(json.loads(uploaded[1])["request"]["labels"], {"document_index": "1"})
+        create_kwargs = mock_client.batches.create.call_args.kwargs
+        self.assertTrue(create_kwargs["src"].startswith("gs://test-bucket/graphs/graph-extract-"))
+        mock_client.batches.get.assert_called_once_with(name="batches/123")
+        mock_client.models.generate_content.assert_not_called()
+
+        self.assertEqual([graph.nodes[0].id for graph in graph_documents], ["Apple", "Google"])
+        self.assertIs(graph_documents[1].source, documents[1])
+
+    @patch('time.sleep')
+    @patch('google.cloud.storage.Client')
+    @patch('google.genai.Client')
+    def test_batch_prediction_keeps_good_outputs_when_some_lines_are_bad(self, mock_client_cls, mock_storage_cls, mock_sleep):
+        # Arrange
+        cache = {}
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            batch_mode="batch",
+            batch_gcs_uri="gs://test-bucket",
+            cache=cache,
+        )
+        documents = [Document(page_content=name) for name in ["Apple", "Google", "Microsoft", "Amazon"]]
+        succeeded_job = MagicMock()
+        succeeded_job.state.name = "JOB_STATE_SUCCEEDED"
+        mock_client_cls.return_value.batches.create.return_value = succeeded_job
+
+        def output_line(index, graph):
+            return json.dumps({
+                "request": {"labels": {"document_index": str(index)}},
+                "response": {"candidates": [{"content": {"parts": [{"text": json.dumps(graph)}]}}]},
+            })
+
+        output_blob = MagicMock()
+        output_blob.name = "graph-extract-run/output/predictions.jsonl"
+        output_blob.download_as_text.return_value = "\n".join([
+            "{truncated",
+            json.dumps({"request": {}, "response": {}}),
+            output_line(0, [{"id": "Apple", "type": "Company", "properties": {}}]),
+            output_line(1, {"extractions": None}),
+            output_line(2, [{"id": "Microsoft", "type": "Company", "properties": ["public"]}]),
+            output_line(3, [{"id": ["Amazon"], "type": "Company"}]),
+        ])
+        mock_bucket = mock_storage_cls.return_value.bucket.return_value
+        mock_bucket.list_blobs.return_value = [output_blob]
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        self.assertTrue(mock_client_cls.return_value.batches.create.call_args.kwargs["src"].startswith("gs://test-bucket/graph-extract-"))
+        self.assertEqual([[node.id for node in graph.nodes] for graph in graph_documents], [["Apple"], [], ["Microsoft"], []])
+        self.assertEqual(graph_documents[2].nodes[0].properties, {})
+        self.assertEqual([graph.source for graph in graph_documents], documents)
+        self.assertEqual(set(cache), {transformer._cache_key(documents[0]), transformer._cache_key(documents[2])})
+
+    def test_batch_mode_requires_gcs_uri(self):
+        with self.assertRaises(ValueError):
+            LangExtractGraphTransformer(
+                project_id=self.project_id,
+                location=self.location,
+                batch_mode="batch",
+            )
+
+    def test_batch_gcs_uri_must_be_a_gs_uri_naming_a_bucket(self):
+        for batch_gcs_uri in ["my-bucket/graphs", "gs://", "gs:///graphs"]:
+            with self.subTest(batch_gcs_uri=batch_gcs_uri), self.assertRaises(ValueError):
+                LangExtractGraphTransformer(
+                    project_id=self.project_id,
+                    location=self.location,
+                    batch_mode="batch",
+                    batch_gcs_uri=batch_gcs_uri,
+                )
+
+    def test_batch_mode_is_rejected_with_langextract(self):
+        with self.assertRaises(ValueError):
+            LangExtractGraphTransformer(
+                project_id=self.project_id,
+                location=self.location,
+                use_langextract=True,
+                batch_mode="auto",
+                batch_gcs_uri="gs://test-bucket/graphs",
+            )
+
+    @patch('time.sleep')
+    @patch('google.genai.Client')
+    def test_direct_documents_run_concurrently_and_retry_rate_limits(self, mock_client_cls, mock_sleep):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            max_concurrency=3,
+        )
+        names = ["Apple", "Google", "Microsoft"]
+        documents = [Document(page_content=name) for name in names]
+        rate_limited = []
+
+        def fake_generate_content(model, contents, config):
+            name = contents[0]["parts"][1]["text"].split("---")[1].strip()
+            if name == "Google" and not rate_limited:
+                rate_limited.append(name)
+                raise genai_errors.ClientError(429, {"error": {"code": 429, "message": "quota", "status": "RESOURCE_EXHAUSTED"}})
+            response = MagicMock()
+            response.text = json.dumps([{"id": name, "type": "Company", "properties": {}}])
+            return response
+
+        mock_client_cls.return_value.models.generate_content.side_effect = fake_generate_content
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        self.assertEqual(mock_client_cls.return_value.models.generate_content.call_count, 4)
+        self.assertEqual(rate_limited, ["Google"])
+        self.assertEqual([graph.nodes[0].id for graph in graph_documents], names)
+
+    @patch('google.genai.Client')
+    def test_disk_cache_evicts_entries_that_no_longer_parse(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        document = Document(page_content="Apple is a company.")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            transformer = LangExtractGraphTransformer(
+                project_id=self.project_id,
+                location=self.location,
+                cache=cache_dir,
+            )
+            transformer.cache[transformer._cache_key(document)] = "{not valid json"
+
+            # Act
+            first = transformer.process_documents([document])
+            second = transformer.process_documents([document])
+
+            # Assert
+            mock_client_cls.return_value.models.generate_content.assert_called_once()
+            self.assertEqual(transformer.cache.get(transformer._cache_key(document)), mock_response.text)
+            self.assertEqual(first[0].nodes[0].id, "Apple")
+            self.assertEqual(second[0].nodes[0].id, "Apple")
+
+    @patch('google.genai.Client')
+    def test_wrong_shaped_answers_are_never_cached(self, mock_client_cls):
+        # Arrange
+        bad_response, good_response = MagicMock(), MagicMock()
+        bad_response.text = json.dumps({"extractions": None})
+        good_response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": ["not", "a", "dict"]}])
+        mock_client_cls.return_value.models.generate_content.side_effect = [bad_response, good_response]
+        cache = {}
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            cache=cache,
+        )
+        document = Document(page_content="Apple is a company.")
+        stale = Document(page_content="Apple makes phones.")
+        cache[transformer._cache_key(stale)] = json.dumps({"extractions": [1, 2]})
+
+        # Act
+        first = transformer.process_documents([document])
+        second = transformer.process_documents([document])
+
+        # Assert
+        self.assertEqual(first[0].nodes, [])
+        self.assertEqual(second[0].nodes[0].id, "Apple")
+        self.assertEqual(second[0].nodes[0].properties, {})
+        self.assertIsNone(transformer._get_cached_graph_data(stale))
+        self.assertEqual(cache, {transformer._cache_key(document): good_response.text})
+
+    @patch('google.genai.Client')
+    def test_concurrent_duplicate_documents_share_one_call(self, mock_client_cls):
+        # Arrange
+        release = threading.Event()
+
+        def slow_generate_content(model, contents, config):
+            release.wait(timeout=5)
+            response = MagicMock()
+            response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+            return response
+
+        mock_client_cls.return_value.models.generate_content.side_effect = slow_generate_content
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            max_concurrency=2,
+        )
+        documents = [Document(page_content="Apple is a company."), Document(page_content="Apple is a company.")]
+        threading.Timer(0.2, release.set).start()
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        mock_client_cls.return_value.models.generate_content.assert_called_once()
+        self.assertEqual([graph.nodes[0].id for graph in graph_documents], ["Apple", "Apple"])
+        self.assertIsNot(graph_documents[0].nodes[0], graph_documents[1].nodes[0])
+        self.assertEqual(transformer._inflight, {})
+
+    @patch('google.genai.Client')
+    def test_context_cache_holds_the_static_prompt(self, mock_client_cls):
+        # Arrange
+        mock_client = mock_client_cls.return_value
+        mock_client.caches.create.return_value.name = "cachedContents/123"
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+        mock_client.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            context_cache_ttl_seconds=3600,
+        )
+
+        # Act
+        transformer.process_documents([Document(page_content="Apple is a company.")])
+        transformer.process_documents([Document(page_content="Apple makes phones.")])
+
+        # Assert
+        mock_client.caches.create.assert_called_once()
+        cache_config = mock_client.caches.create.call_args.kwargs["config"]
+        self.assertEqual(cache_config.ttl, "3600s")
+        self.assertEqual(mock_client.models.generate_content.call_count, 2)
+        for call in mock_client.models.generate_content.call_args_list:
+            self.assertEqual(call.kwargs["config"].cached_content, "cachedContents/123")
+            self.assertEqual(call.kwargs["config"].response_mime_type, "application/json")
+            parts = call.kwargs["contents"][0]["parts"]
+            self.assertEqual(len(parts), 1)
+            self.assertIn("Text to process", parts[0]["text"])
+
+    @patch('time.sleep')
+    @patch('google.genai.Client')
+    def test_context_cache_retries_transient_errors_and_stops_on_bad_request(self, mock_client_cls, mock_sleep):
+        # Arrange
+        mock_client = mock_client_cls.return_value
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+        mock_client.models.generate_content.return_value = mock_response
+        unavailable = genai_errors.ServerError(503, {"error": {"code": 503, "message": "busy", "status": "UNAVAILABLE"}})
+        too_small = genai_errors.ClientError(400, {"error": {"code": 400, "message": "too small", "status": "INVALID_ARGUMENT"}})
+        mock_client.caches.create.side_effect = [unavailable, too_small]
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            context_cache_ttl_seconds=3600,
+        )
+
+        # Act
+        transformer.process_documents([Document(page_content="Apple is a company.")])
+        transformer.process_documents([Document(page_content="Apple makes phones.")])
+
+        # Assert
+        self.assertEqual(mock_client.caches.create.call_count, 2)
+        self.assertEqual(transformer.context_cache_ttl_seconds, 3600)
+        for call in mock_client.models.generate_content.call_args_list:
+            self.assertIsNone(call.kwargs["config"].cached_content)
+            self.assertEqual(len(call.kwargs["contents"][0]["parts"]), 2)
+
+    @patch('google.genai.Client')
+    def test_lenient_json_from_the_model_still_parses(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = '[{"id": "Apple", "type": "Company", "properties": {"score": NaN}}]'
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+        )
+
+        # Act
+        graph_documents = transformer.process_documents([Document(page_content="Apple is a company.")])
+
+        # Assert
+        node = graph_documents[0].nodes[0]
+        self.assertEqual(node.id, "Apple")
+        self.assertTrue(math.isnan(node.properties["prop_score"]))
+
+    @patch('google.genai.Client')
+    def test_aprocess_documents_uses_async_client_for_direct_calls(self, mock_client_cls):
+        # Arrange
+        mock_client = mock_client_cls.return_value
+
+        async def fake_generate_content(model, contents, config):
+            name = contents[0]["parts"][1]["text"].split("---")[1].strip()
+            if name == "broken":
+                raise RuntimeError("model unavailable")
+            response = MagicMock()
+            response.text = json.dumps([{"id": name, "type": "Company", "properties": {}}])
+            return response
+
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=fake_generate_content)
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            max_concurrency=2,
+        )
+        documents = [Document(page_content=name) for name in ["Apple", "broken", "Google", "Apple"]]
+
+        # Act
+        graph_documents = asyncio.run(transformer.aprocess_documents(documents))
+
+        # Assert
+        mock_client.models.generate_content.assert_not_called()
+        self.assertEqual(graph_documents[0].nodes[0].id, "Apple")
+        self.assertEqual(graph_documents[1].nodes, [])
+        self.assertEqual(graph_documents[2].nodes[0].id, "Google")
+        self.assertEqual(graph_documents[3].nodes[0].id, "Apple")
+
+    @patch('google.genai.Client')
+    def test_aprocess_documents_only_uses_worker_threads_for_cache_io(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([{"id": "Apple", "type": "Company", "properties": {}}])
+        mock_client_cls.return_value.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        uncached = LangExtractGraphTransformer(project_id=self.project_id, location=self.location)
+        cached = LangExtractGraphTransformer(project_id=self.project_id, location=self.location, cache={})
+        documents = [Document(page_content="Apple is a company.")]
+
+        # Act
+        with patch('asyncio.to_thread', wraps=asyncio.to_thread) as mock_to_thread:
+            asyncio.run(uncached.aprocess_documents(documents))
+            uncached_thread_calls = mock_to_thread.call_count
+            asyncio.run(cached.aprocess_documents(documents))
+            graph_documents = asyncio.run(cached.aprocess_documents(documents))
+
+        # Assert
+        self.assertEqual(uncached_thread_calls, 0)
+        self.assertEqual(mock_to_thread.call_count, 3) # read + write, then a cache hit
+        self.assertEqual(mock_client_cls.return_value.aio.models.generate_content.await_count, 2)
+        self.assertEqual(graph_documents[0].nodes[0].id, "Apple")
+
+    @patch('google.genai.Client')
+    def test_property_keys_are_sanitized(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([
+            {"id": "Apple", "type": "Company", "properties": {"Founded Year": 1976, "HQ-City": "Cupertino"}},
+        ])
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+        )
+
+        # Act
+        graph_documents = transformer.process_documents([Document(page_content="Apple was founded in 1976.")])
+
+        # Assert
+        self.assertEqual(
+            graph_documents[0].nodes[0].properties,
+            {"prop_founded_year": 1976, "prop_hq_city": "Cupertino"},
+        )
+
+    @patch('google.genai.Client')
+    def test_non_ascii_property_keys_are_preserved(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([
+            {"id": "Apple", "type": "Company", "properties": {"成立年份": 1976, "总部": "Cupertino", "Höhe": 3, "营业额": 10}},
+        ])
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            node_properties=["成立年份", "总部", "Höhe"],
+        )
+
+        # Act
+        graph_documents = transformer.process_documents([Document(page_content="Apple was founded in 1976.")])
+
+        # Assert
+        # Same-length non-ASCII keys stay distinct, and the allow-list matches only the requested ones
+        self.assertEqual(
+            graph_documents[0].nodes[0].properties,
+            {"prop_成立年份": 1976, "prop_总部": "Cupertino", "prop_höhe": 3},
+        )
+
+    @patch('google.genai.Client')
+    def test_genai_client_is_shared_across_instances(self, mock_client_cls):
+        # Act
+        first = LangExtractGraphTransformer(project_id=self.project_id, location=self.location)
+        second = LangExtractGraphTransformer(project_id=self.project_id, location=self.location)
+        LangExtractGraphTransformer(project_id=self.project_id, location="other-location")
+
+        # Assert
+        self.assertEqual(mock_client_cls.call_count, 2)
+        self.assertIs(first._client, second._client)
+        mock_client_cls.assert_any_call(vertexai=True, project=self.project_id, location="other-location")
+
+    @patch('google.genai.Client')
+    def test_relationships_resolve_by_id_and_skip_missing_endpoints(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        # Relationships may precede their nodes and may reference nodes that were never extracted
+        mock_response.text = json.dumps([
+            {"source": "Microsoft", "target": "Activision Blizzard", "type": "ACQUIRED", "properties": {}},
+            {"source": "Microsoft", "target": "Redmond", "type": "HEADQUARTERED_IN", "properties": {}},
+            {"id": "Microsoft", "type": "Company", "properties": {}},
+            {"id": "Activision Blizzard", "type": "Company", "properties": {}},
+            {"id": "Microsoft", "type": "Organization", "properties": {}},
+        ])
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+        )
+
+        # Act
+        graph_documents = transformer.process_documents([Document(page_content="Microsoft acquired Activision Blizzard.")])
+
+        # Assert
+        graph_document = graph_documents[0]
+        nodes_by_id = by_id(graph_document.nodes)
+        self.assertEqual(len(graph_document.nodes), 2)
+        self.assertEqual(nodes_by_id["Microsoft"].type, "Company")
+        self.assertEqual(len(graph_document.relationships), 1)
+        relationship = graph_document.relationships[0]
+        self.assertIs(relationship.source, nodes_by_id["Microsoft"])
+        self.assertIs(relationship.target, nodes_by_id["Activision Blizzard"])
+
+    @patch('langextract.extract')
+    def test_batch_sends_duplicate_texts_once(self, mock_extract):
+        # Arrange
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            use_langextract=True,
+        )
+        documents = [Document(page_content=name) for name in ["Apple", "Google", "Apple"]]
+
+        def fake_extract(text_or_documents, **kwargs):
+            annotated_documents = []
+            for lx_document in text_or_documents:
+                annotated_document = MagicMock()
+                annotated_document.document_id = lx_document.document_id
+                annotated_document.extractions = [
+                    lx.data.Extraction(
+                        extraction_class="GraphJSON",
+                        extraction_text=json.dumps([{"id": lx_document.text, "type": "Company", "properties": {}}])
+                    )
+                ]
+                annotated_documents.append(annotated_document)
+            return annotated_documents
+
+        mock_extract.side_effect = fake_extract
+
+        # Act
+        graph_documents = transformer.process_documents(documents)
+
+        # Assert
+        lx_documents = mock_extract.call_args.kwargs["text_or_documents"]
+        self.assertEqual([d.text for d in lx_documents], ["Apple", "Google"])
+        self.assertEqual([graph.nodes[0].id for graph in graph_documents], ["Apple", "Google", "Apple"])
+        self.assertIs(graph_documents[2].source, documents[2])
+        self.assertIsNot(graph_documents[0].nodes[0], graph_documents[2].nodes[0])
+
+    @patch('google.genai.Client')
+    def test_requested_properties_filter_extracted_properties(self, mock_client_cls):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.text = json.dumps([
+            {"id": "Microsoft", "type": "Company", "properties": {"Sector": "Tech", "ceo": "Satya Nadella"}},
+            {"id": "Activision Blizzard", "type": "Company", "properties": {}},
+            {"source": "Microsoft", "target": "Activision Blizzard", "type": "ACQUIRED",
+             "properties": {"date": "January 18, 2022", "value_usd": 68700000000}},
+        ])
+        mock_client_cls.return_value.models.generate_content.return_value = mock_response
+        transformer = LangExtractGraphTransformer(
+            project_id=self.project_id,
+            location=self.location,
+            node_properties=["sector"],
+            relationship_properties=["date"],
+        )
+
+        # Act
+        graph_documents = transformer.process_documents([Document(page_content="Microsoft acquired Activision Blizzard.")])
+
+        # Assert
+        graph_document = graph_documents[0]
+        self.assertEqual(by_id(graph_document.nodes)["Microsoft"].properties, {"prop_sector": "Tech"})
+        self.assertEqual(graph_document.relationships[0].properties, {"prop_date": "January 18, 2022"})
+
 if __name__ == '__main__':
     unittest.main()